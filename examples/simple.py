@@ -1,4 +1,5 @@
 from metevents.events import StormEvents
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 
@@ -24,7 +25,9 @@ def main():
 
     # The structure of this can make plotting them convenient.
     fig, ax = plt.subplots(1)
-    cumulative = storms.data.cumsum()
+    cumulative = pd.Series(
+        np.nancumsum(storms.data.to_numpy()), index=storms.data.index
+    )
     top = cumulative.max()
 
     # Loop over the events and fill in between where our storms are
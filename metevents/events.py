@@ -1,49 +1,211 @@
 import logging
 import numpy as np
 import pandas as pd
-from datetime import timedelta
 from metloom.pointdata import CDECPointData, SnotelPointData, MesowestPointData
-from pandas.tseries.frequencies import to_offset
 from scipy.signal import find_peaks
 
 # local imports
 from metevents.periods import CumulativePeriod, BaseTimePeriod
-from metevents.utilities import determine_freq
+from metevents.utilities import index_ns
 
 
 LOG = logging.getLogger(__name__)
 
+# Point data classes keyed by their lower case datasource name
+_SOURCES = {
+    c.DATASOURCE.lower(): c
+    for c in (SnotelPointData, CDECPointData, MesowestPointData)
+}
+
+
+# Relative round off allowed when comparing prefix sum differences
+_ROUND_OFF = 8 * np.finfo(np.float64).eps
+
+
+def _true_runs(mask):
+    """
+    Find the contiguous runs of True in a boolean array
+
+    Args:
+        mask: 1D boolean numpy array
+    Returns:
+        tuple: arrays of the start positions and the (exclusive) stop
+            positions of each run
+    """
+    edges = np.diff(np.concatenate([[0], mask.view(np.int8), [0]]))
+    starts = np.flatnonzero(edges == 1)
+    stops = np.flatnonzero(edges == -1)
+    return starts, stops
+
+
+def _merge_storms(starts, stops, csum, ts, dt, max_storm, min_storm_total):
+    """
+    Merge runs of mass into storms. A storm ends once there has been enough
+    time without mass or it has gone on too long, as long as it has
+    accumulated enough mass.
+
+    Args:
+        starts: start positions of the runs of mass
+        stops: exclusive stop positions of the runs of mass
+        csum: prefix sum of the mass with a leading zero
+        ts: int64 nanosecond timestamps of the data
+        dt: nanoseconds without mass needed to end a storm
+        max_storm: maximum nanoseconds a storm can last
+        min_storm_total: Total storm mass to be considered a complete storm
+    Returns:
+        tuple: arrays of the start positions, including the time step
+            leading into the storm, and the exclusive stop positions of
+            each storm
+    """
+    N_groups = len(starts)
+    if N_groups == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    # Has there been enough hours without mass after each group
+    lasts = stops - 1
+    next_starts = np.append(starts[1:], lasts[-1])
+    enough_hours_wo_precip = ((ts[next_starts] - ts[lasts]) > dt).tolist()
+
+    # Allow for the round off of the prefix sum differences, scaled by the
+    # magnitude of the accumulated mass
+    round_off = _ROUND_OFF * np.abs(csum).max()
+
+    # Evaluate each group of mass conditions against the timing
+    next_starts = next_starts.tolist()
+    start = int(starts[0])
+    event_bounds = []
+    for i, curr_stop in enumerate(lasts.tolist()):
+        # track storm total and duration
+        total = csum[curr_stop + 1] - csum[start]
+        duration = ts[curr_stop] - ts[start]
+
+        # Has storm gone on too long
+        storm_duration_too_long = duration > max_storm
+        # Has enough mass accumulated to be considered a storm
+        enough_storm_mass = total + round_off >= min_storm_total
+        base_condition = (
+            enough_hours_wo_precip[i] or storm_duration_too_long
+        )
+        condition = (base_condition and enough_storm_mass)
+
+        if condition or i == N_groups - 1:
+            # Include the time step leading into the storm
+            event_bounds.append((max(start - 1, 0), curr_stop + 1))
+            # Update start for the next storm
+            start = next_starts[i]
+
+    bounds = np.array(event_bounds, dtype=np.int64)
+    return bounds[:, 0], bounds[:, 1]
+
 
 class BaseEvents:
+    # Period class used to build each event from the data
+    PERIOD_CLASS = BaseTimePeriod
+
     def __init__(self, data):
-        self._events = []
         self.data = data
         self._groups = []
         self._group_ids = None
 
+    @property
+    def data(self):
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self._data = data
+        # Raw values and nanosecond timestamps the detectors work on
+        self._vals = data.to_numpy()
+        self._ts_ns = (
+            index_ns(data.index) if isinstance(data.index, pd.DatetimeIndex)
+            else None
+        )
+        # Any events found belong to the previous data
+        self._set_bounds(
+            np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        )
+
     @property
     def events(self):
+        if self._events is None:
+            self._events = [
+                self._build_period(start, stop)
+                for start, stop in zip(
+                    self._starts.tolist(), self._stops.tolist()
+                )
+            ]
         return self._events
 
     @property
     def N(self):
-        return len(self.events)
+        return len(self._starts)
+
+    @property
+    def durations(self):
+        """
+        Duration of every event, computed from the event bounds without
+        building the period objects
+        """
+        index = self.data.index
+        return index[self._stops - 1] - index[self._starts]
 
     def find(self, *args, **kwargs):
         """
         Function to be defined for specific events in timeseries data. Performs
-        the actual detection of the events. Should assign self._events
+        the actual detection of the events. Should assign the event bounds
+        with self._set_bounds
         """
         raise NotImplementedError("find function not implemented.")
 
+    def _build_period(self, start, stop):
+        """
+        Build the period object of a single event
+
+        Args:
+            start: start position of the event
+            stop: exclusive stop position of the event
+        """
+        return self.PERIOD_CLASS(self.data.iloc[start:stop])
+
+    def _set_bounds(self, starts, stops):
+        """
+        Store the positional bounds of the found events. The period objects
+        are only built once events is accessed.
+
+        Args:
+            starts: start positions of each event
+            stops: exclusive stop positions of each event
+        """
+        self._starts = np.asarray(starts, dtype=np.int64)
+        self._stops = np.asarray(stops, dtype=np.int64)
+        self._events = None
+
     @staticmethod
     def group_condition_by_time(ind):
-        ind_sum = ind.eq(False).cumsum()
+        """
+        Group contiguous runs of True in a boolean series
 
-        # Isolate the ind_sum by positions that are
-        # True and group them together
-        time_groups = ind_sum.loc[ind.eq(True)].groupby(ind_sum)
-        groups = time_groups.groups
+        Args:
+            ind: boolean pandas series indexed by time
+        Returns:
+            tuple: dictionary of the running count of False values at the
+                start of each run to the DatetimeIndex of the run, and the
+                running count of False values in ind
+        """
+        arr = np.asarray(ind.values, dtype=bool)
+        starts, stops = _true_runs(arr)
+        idx = ind.index
+
+        # Running count of False, constant across each run of True
+        false_count = np.logical_not(arr).cumsum(dtype=np.int64)
+        groups = {
+            k: idx[s:e] for k, s, e in zip(
+                false_count[starts].tolist(), starts.tolist(), stops.tolist()
+            )
+        }
+
+        # Rows of ind that are True are labelled by their group key
+        ind_sum = pd.Series(false_count, index=idx)
         return groups, ind_sum
 
     @classmethod
@@ -52,6 +214,12 @@ class BaseEvents:
 
 
 class StormEvents(BaseEvents):
+    PERIOD_CLASS = CumulativePeriod
+
+    def __init__(self, data):
+        super().__init__(data)
+        # Prefix sum of the mass from the last find, shared by all events
+        self._csum = None
 
     def find(self, instant_mass_to_start=0.1, min_storm_total=0.5,
              hours_to_stop=24, max_storm_hours=336):
@@ -64,61 +232,46 @@ class StormEvents(BaseEvents):
         Args:
             instant_mass_to_start: mass per time step to consider the
                 beginning of a storm
-            min_storm_total: Total storm mass to be considered a complete storm
+            min_storm_total: Total storm mass to be considered a complete storm.
+                Totals short of it by float round off still count.
             hours_to_stop: minimum hours of mass less than instant threshold to
                 end a storm
             max_storm_hours: Maximum hours a storm can.
         """
-        # group main condition by time
-        ind = self.data >= instant_mass_to_start
-        groups, _ = self.group_condition_by_time(ind)
-
-        freq = determine_freq(ind)
-        tstep = pd.to_timedelta(to_offset(freq))
-        dt = timedelta(hours=hours_to_stop)
-        max_storm = timedelta(hours=max_storm_hours)
-
-        group_list = sorted(list(groups.items()))
-        N_groups = len(group_list)
-
-        # Evaluate each group of mass conditions against the timing
-        for i, (event_id, curr_group) in enumerate(group_list):
-            curr_start = curr_group.min()
-            curr_stop = curr_group.max()
-            if i == 0:
-                start = curr_start
-
-            # Grab next
-            nx_idx = i + 1
-            if nx_idx < N_groups:
-                next_group = group_list[nx_idx][1]
-                next_start = next_group.min()
-
-            else:
-                next_start = curr_stop
-            # track storm total and no_precip_d
-            total = self.data.loc[start:curr_stop].sum()
-            duration = curr_stop - start
-
-            # Has there been enough hours without mass
-            enough_hours_wo_precip = (next_start - curr_stop) > dt
-            # Has storm gone on too long
-            storm_duration_too_long = duration > max_storm
-            # Has enough mass accumulated to be considered a storm
-            enough_storm_mass = total >= min_storm_total
-            base_condition = (
-                enough_hours_wo_precip or storm_duration_too_long
-            )
-            condition = (base_condition and enough_storm_mass)
+        vals = self._vals
 
-            if condition or nx_idx == N_groups:
-                # Watch out for beginning
-                start = start - tstep if start != self.data.index[0] else start
+        # Find contiguous runs of mass at or above the starting threshold
+        starts, stops = _true_runs(vals >= instant_mass_to_start)
 
-                event = CumulativePeriod(self.data.loc[start:curr_stop])
-                self._events.append(event)
-                # Update start for the next storm
-                start = next_start
+        # Prefix sum so any storm total is a difference of two values
+        csum = self._csum = np.empty(len(vals) + 1)
+        csum[0] = 0.0
+        np.nancumsum(vals, out=csum[1:])
+
+        event_starts, event_stops = _merge_storms(
+            starts, stops, csum, self._ts_ns,
+            pd.Timedelta(hours=hours_to_stop).value,
+            pd.Timedelta(hours=max_storm_hours).value,
+            min_storm_total
+        )
+        self._set_bounds(event_starts, event_stops)
+
+    @property
+    def totals(self):
+        """
+        Total mass of every storm as an array, from the prefix sum of the
+        last find
+        """
+        if self._csum is None:
+            return np.empty(0)
+        return self._csum[self._stops] - self._csum[self._starts]
+
+    def _build_period(self, start, stop):
+        # Storm totals come straight from the prefix sum
+        return self.PERIOD_CLASS(
+            self.data.iloc[start:stop], csum=self._csum, start_iloc=start,
+            stop_iloc=stop
+        )
 
     @classmethod
     def from_station(cls, station_id, start, stop, station_name='unknown',
@@ -135,18 +288,13 @@ class StormEvents(BaseEvents):
                 NRCS, mesowest, CDEC
             station_name: String name of the station to pass to pointdata
         """
-        pnt = None
-        pnt_classes = [SnotelPointData, CDECPointData, MesowestPointData]
-        for STATION_CLASS in pnt_classes:
-            if STATION_CLASS.DATASOURCE.lower() == source.lower():
-                pnt = STATION_CLASS(station_id, station_name)
-                break
-
-        if pnt is None:
+        STATION_CLASS = _SOURCES.get(source.lower())
+        if STATION_CLASS is None:
             raise ValueError(
                 f'Datasource {source} is invalid. Use '
-                f'{", ".join([c.DATASOURCE for c in pnt_classes])}'
+                f'{", ".join([c.DATASOURCE for c in _SOURCES.values()])}'
             )
+        pnt = STATION_CLASS(station_id, station_name)
 
         # Pull data
         variable = pnt.ALLOWED_VARIABLES.PRECIPITATIONACCUM
@@ -162,7 +310,12 @@ class StormEvents(BaseEvents):
         else:
             df = df.reset_index().set_index('datetime')
 
-        return cls(df[variable.name].diff())
+        # Incremental precip from the accumulated values
+        accum = df[variable.name].to_numpy(dtype=np.float64)
+        precip = np.empty_like(accum)
+        precip[:1] = np.nan
+        np.subtract(accum[1:], accum[:-1], out=precip[1:])
+        return cls(pd.Series(precip, index=df.index, name=variable.name))
 
 
 class SpikeValleyEvent(BaseEvents):
@@ -186,15 +339,7 @@ class SpikeValleyEvent(BaseEvents):
             prominence=prominence, width=width
         )
         # Group the events
-        groups, _ = self.group_condition_by_time(ind)
-        group_list = sorted(list(groups.items()))
-
-        # Build the list of events
-        for i, (event_id, curr_group) in enumerate(group_list):
-            curr_start = curr_group.min()
-            curr_stop = curr_group.max()
-            event = BaseTimePeriod(self.data.loc[curr_start:curr_stop])
-            self._events.append(event)
+        self._set_bounds(*_true_runs(ind.to_numpy()))
 
     @staticmethod
     def detect_spikes_using_find_peaks(
@@ -218,9 +363,10 @@ class SpikeValleyEvent(BaseEvents):
         """
         width = width or (0, 3)
 
-        # find peaks
+        # find peaks on the raw values
+        vals = series.to_numpy(dtype=np.float64)
         peaks, peak_info = find_peaks(
-            series, height=height, threshold=threshold, prominence=prominence,
+            vals, height=height, threshold=threshold, prominence=prominence,
             width=width
         )
         # get the index span
@@ -228,24 +374,27 @@ class SpikeValleyEvent(BaseEvents):
 
         # find valleys
         valleys, valley_info = find_peaks(
-            # Data gets flipped around y axis
-            series * -1.0,
+            # Data gets flipped around y axis, vals may share memory with
+            # the series so it is not negated in place
+            np.negative(vals),
             height=height, threshold=threshold, prominence=prominence,
             width=width
         )
         valley_width_values = valley_info["widths"]
 
-        spike_index = pd.Series(index=series.index, data=[False] * len(series))
-        # Set true for the width of the peak surrounding the center
-        for p, w in zip(peaks, peak_width_values):
-            p1 = int(p - w)
-            p2 = int(p + w) + 1
-            spike_index.iloc[p1:p2] = True
-        for p, w in zip(valleys, valley_width_values):
-            p1 = int(p - w)
-            p2 = int(p + w) + 1
-            spike_index.iloc[p1:p2] = True
-        return spike_index
+        # Set true for the width of each peak and valley surrounding the
+        # center. Each span adds one at its start and removes one after its
+        # end so the running sum is positive wherever any span covers
+        n = len(series)
+        centers = np.concatenate([peaks, valleys])
+        widths = np.concatenate([peak_width_values, valley_width_values])
+        p1 = (centers - widths).astype(np.int64).clip(0)
+        p2 = ((centers + widths).astype(np.int64) + 1).clip(max=n)
+        delta = (
+            np.bincount(p1, minlength=n + 1) - np.bincount(p2, minlength=n + 1)
+        )
+        mask = np.cumsum(delta[:-1]) > 0
+        return pd.Series(mask, index=series.index)
 
 
 class DataGapEvent(BaseEvents):
@@ -259,43 +408,38 @@ class DataGapEvent(BaseEvents):
             expected_frequency: expected frequency of timeseries
 
         """
-        # find all nan indices
-        ind = pd.isna(self.data)
-
-        # Ensure the dataframe is sorted by index
-        self.data = self.data.sort_index()
-
-        # Calculate differences between consecutive timestamps
-        differences = self.data.index.to_series().diff()
+        # Ensure the dataframe is sorted by index. Event bounds are positions
+        # in the sorted data so it replaces the original when out of order
+        if not self.data.index.is_monotonic_increasing:
+            self.data = self.data.sort_index()
 
         # Assume a daily frequency for this example
         expected_difference = pd.Timedelta(expected_frequency)
 
-        # Group the nan data events
-        groups, _ = self.group_condition_by_time(ind)
-
-        # Identify gap start points
-        # gap_starts = self.data.index[differences > expected_difference]
-        gaps = differences[differences > expected_difference].dropna()
-        for idg, gap in zip(gaps.index, gaps):
-            # TODO: this logic makes missing 4 days into a 6 day gap
-            gap_iloc = ind.index.get_loc(idg)
-            # Create a group of the missing indices
-            groups[gap_iloc] = pd.DatetimeIndex(
-                [idg - gap, idg]
-            )
+        # Group the nan data events, floats can skip pandas' generic check
+        vals = self._vals
+        nan_ind = np.isnan(vals) if vals.dtype.kind == 'f' else pd.isna(vals)
+        nan_starts, nan_stops = _true_runs(nan_ind)
 
-        # sort the group list
-        group_list = sorted(list(groups.items()))
+        # Identify gaps between consecutive timestamps, each gap event spans
+        # the value before and the value after the missing time
+        # TODO: this logic makes missing 4 days into a 6 day gap
+        ts = self._ts_ns
+        differences = np.diff(ts)
+        gap_starts = np.flatnonzero(differences > expected_difference.value)
+        gap_stops = gap_starts + 2
 
-        # Build the list of events
-        for event_id, curr_group in group_list:
-            curr_start = curr_group.min()
-            curr_stop = curr_group.max()
-            event = BaseTimePeriod(self.data.loc[curr_start:curr_stop])
-            # only keep events that are longer than what is configured
-            if event.duration >= min_len * expected_difference:
-                self._events.append(event)
+        # Combine the nan runs and the gaps in time order, a stable sort
+        # keeps a nan run ahead of a gap starting at the same position
+        starts = np.concatenate([nan_starts, gap_starts])
+        stops = np.concatenate([nan_stops, gap_stops])
+        order = np.argsort(starts, kind='mergesort')
+        starts, stops = starts[order], stops[order]
+
+        # only keep events that are longer than what is configured
+        min_duration = (min_len * expected_difference).value
+        keep = (ts[stops - 1] - ts[starts]) >= min_duration
+        self._set_bounds(starts[keep], stops[keep])
 
 
 class FlatLineEvent(BaseEvents):
@@ -310,24 +454,17 @@ class FlatLineEvent(BaseEvents):
                 value of slope <=slope thresh will be flagged
 
         """
-        # find the slope
-        diff = self.data.diff()
-        # find the absolute slope within our threshold
-        ind = np.abs(diff) <= slope_thresh
-
-        # Group the nan data events
-        groups, _ = self.group_condition_by_time(ind)
-        # sort the group list
-        group_list = sorted(list(groups.items()))
-
-        # Build the list of events
-        for event_id, curr_group in group_list:
-            curr_start = curr_group.min()
-            curr_stop = curr_group.max()
-            event = BaseTimePeriod(self.data.loc[curr_start:curr_stop])
-            # only keep events that are longer than what is configured
-            if len(event.data) >= min_len:
-                self._events.append(event)
+        # find the absolute slope within our threshold, the first value
+        # has no slope
+        vals = self._vals
+        ind = np.zeros(len(vals), dtype=bool)
+        ind[1:] = np.abs(np.diff(vals)) <= slope_thresh
+
+        # Group the flat values and only keep runs that are longer than
+        # what is configured before building any events
+        starts, stops = _true_runs(ind)
+        keep = (stops - starts) >= min_len
+        self._set_bounds(starts[keep], stops[keep])
 
 
 class ExtremeValueEvent(BaseEvents):
@@ -342,20 +479,17 @@ class ExtremeValueEvent(BaseEvents):
 
         """
         # Indices where data is outside of expected range
-        ind = (self.data > expected_max) | (self.data < expected_min)
+        vals = self._vals
+        ind = (vals > expected_max) | (vals < expected_min)
 
-        # Group the nan data events
-        groups, _ = self.group_condition_by_time(ind)
-        # sort the group list
-        group_list = sorted(list(groups.items()))
+        # Clean data has nothing out of range, skip the grouping entirely
+        if not ind.any():
+            empty = np.empty(0, dtype=np.int64)
+            self._set_bounds(empty, empty)
+            return
 
-        # Build the list of events
-        for event_id, curr_group in group_list:
-            curr_start = curr_group.min()
-            curr_stop = curr_group.max()
-            event = BaseTimePeriod(self.data.loc[curr_start:curr_stop])
-            # store the events
-            self._events.append(event)
+        # Group the out of range events
+        self._set_bounds(*_true_runs(ind))
 
 
 class ExtremeChangeEvent(BaseEvents):
@@ -383,29 +517,20 @@ class ExtremeChangeEvent(BaseEvents):
         if positive_slope_thresh is None and negative_slope_thresh is None:
             raise ValueError("One slope threshold must be provided")
 
-        # find the slope
-        diff = self.data.diff()
+        # find the slope, the first value has none
+        vals = self._vals
+        diff = np.full(len(vals), np.nan)
+        np.subtract(vals[1:], vals[:-1], out=diff[1:])
 
-        ind_pos = pd.Series([False] * len(diff), index=diff.index)
-        ind_neg = pd.Series([False] * len(diff), index=diff.index)
+        # flag slopes past either threshold into one mask
+        ind = np.zeros(len(vals), dtype=bool)
         if positive_slope_thresh is not None:
-            ind_pos = diff >= positive_slope_thresh
+            np.greater_equal(diff, positive_slope_thresh, out=ind)
         if negative_slope_thresh is not None:
-            ind_neg = diff <= negative_slope_thresh
-
-        # join the index
-        ind = ind_pos | ind_neg
-
-        # Group the nan data events
-        groups, _ = self.group_condition_by_time(ind)
-        # sort the group list
-        group_list = sorted(list(groups.items()))
-
-        # Build the list of events
-        for event_id, curr_group in group_list:
-            curr_start = curr_group.min()
-            curr_stop = curr_group.max()
-            event = BaseTimePeriod(self.data.loc[curr_start:curr_stop])
-            # only keep events that are longer than what is configured
-            if len(event.data) >= min_len:
-                self._events.append(event)
+            ind |= diff <= negative_slope_thresh
+
+        # Group the excessive change events and only keep events that are
+        # longer than what is configured
+        starts, stops = _true_runs(ind)
+        keep = (stops - starts) >= min_len
+        self._set_bounds(starts[keep], stops[keep])
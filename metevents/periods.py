@@ -1,8 +1,13 @@
+import numpy as np
+
+
 class BaseTimePeriod:
     """
     Class for holding on to periods of timeseries data
     that meets criteria
     """
+    __slots__ = ('_data', '_start', '_stop', '_duration')
+
     def __init__(self, data):
         self._data = data
         self._start = None
@@ -33,14 +38,34 @@ class BaseTimePeriod:
 
 
 class CumulativePeriod(BaseTimePeriod):
-    def __init__(self, data):
+    __slots__ = ('_total', '_csum', '_start_iloc', '_stop_iloc')
+
+    def __init__(self, data, csum=None, start_iloc=None, stop_iloc=None):
+        """
+        Args:
+            data: pandas series of the period
+            csum: Optional prefix sum (with a leading zero) of the series
+                data was sliced from, lets total skip summing the data
+            start_iloc: position of the start of data in that series
+            stop_iloc: exclusive position of the stop of data in that series
+        """
         super().__init__(data)
         self._total = None
+        self._csum = csum
+        self._start_iloc = start_iloc
+        self._stop_iloc = stop_iloc
 
     @property
     def total(self):
         if self._total is None:
-            self._total = self._data.sum()
+            if self._csum is not None:
+                self._total = (
+                    self._csum[self._stop_iloc] - self._csum[self._start_iloc]
+                )
+            else:
+                self._total = np.nansum(
+                    self._data.to_numpy(dtype=np.float64)
+                )
 
         return self._total
 
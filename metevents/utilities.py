@@ -1,3 +1,38 @@
+import numpy as np
+import pandas as pd
+from pandas.tseries.frequencies import to_offset
+
+
+def index_ns(index):
+    """
+    Timestamps of a datetime index as integer nanoseconds, whatever the
+    unit the index is stored in.
+    Args:
+        index: pandas DatetimeIndex.
+    Returns:
+        arr: int64 numpy array of nanoseconds since the epoch.
+    """
+    return index.values.astype('datetime64[ns]').view(np.int64)
+
+
+def determine_freq_ns(index):
+    """
+    Find the constant spacing of a datetime index in nanoseconds.
+    Args:
+        index: pandas DatetimeIndex.
+    Returns:
+        freq: spacing in integer nanoseconds, None if it is irregular.
+    """
+    # Check the spacing on the raw nanoseconds to avoid building a
+    # TimedeltaIndex of every difference
+    arr = index_ns(index)
+    if len(arr) < 2:
+        return None
+    d0 = int(arr[1] - arr[0])
+    if d0 <= 0 or not np.all(np.diff(arr) == d0):
+        return None
+    return d0
+
 
 def determine_freq(series):
     """
@@ -9,7 +44,7 @@ def determine_freq(series):
     """
     freq = series.index.freqstr
     if freq is None:
-        result = (series.index[1:-1] - series.index[0:-2]).unique()
-        if len(result) == 1:
-            freq = result[0].resolution_string
+        d0 = determine_freq_ns(series.index)
+        if d0 is not None:
+            freq = to_offset(pd.Timedelta(d0)).freqstr
     return freq
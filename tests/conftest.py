@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+from pandas import DatetimeIndex
+
+
+@pytest.fixture(scope="session")
+def base_index():
+    """
+    Daily DatetimeIndex built once in numpy, slice it for shorter series
+    """
+    days = np.arange(4096).astype('timedelta64[D]')
+    return DatetimeIndex(np.datetime64('2023-01-01', 'ns') + days, freq='D')
+
+
+@pytest.fixture(scope="session")
+def as_unit():
+    """
+    Convert a DatetimeIndex to another resolution, skipping the test on
+    pandas versions that only store nanoseconds
+    """
+    def _as_unit(index, unit):
+        if not hasattr(index, 'as_unit'):
+            pytest.skip('pandas only stores nanosecond datetime indexes')
+        return index.as_unit(unit)
+    return _as_unit
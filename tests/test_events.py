@@ -1,21 +1,62 @@
-from datetime import datetime, timedelta
+from datetime import datetime
 from pathlib import Path
 
 import numpy as np
 import pandas as pd
 import pytest
-from pandas import DatetimeIndex
 
 from metevents.events import (
     StormEvents, SpikeValleyEvent, DataGapEvent, FlatLineEvent,
-    ExtremeValueEvent, ExtremeChangeEvent
+    ExtremeValueEvent, ExtremeChangeEvent, BaseEvents, _SOURCES
 )
 
 
 @pytest.fixture()
-def series(data):
-    index = [datetime(2023, 1, 1) + timedelta(days=i) for i in range(len(data))]
-    return pd.Series(data, index=DatetimeIndex(index, freq='D'))
+def series(data, base_index):
+    arr = np.asarray(data, dtype=np.float64)
+    return pd.Series(arr, index=base_index[:arr.size])
+
+
+class EventBoundsMixin:
+    """
+    Table driven check of each found event against the EXPECTED_STARTS,
+    EXPECTED_STOPS and EXPECTED_DURATIONS of the test class
+    """
+
+    def pytest_generate_tests(self, metafunc):
+        if "idx" in metafunc.fixturenames:
+            metafunc.parametrize("idx", range(len(metafunc.cls.EXPECTED_STARTS)))
+
+    def test_event_bounds(self, found_events, idx):
+        event = found_events.events[idx]
+        assert event.start == self.EXPECTED_STARTS[idx]
+        assert event.stop == self.EXPECTED_STOPS[idx]
+        assert event.duration == self.EXPECTED_DURATIONS[idx]
+
+
+class TestGroupConditionByTime:
+    @pytest.mark.parametrize('data, expected', [
+        ([False, True, True, False, True, True], {1: [1, 2], 2: [4, 5]}),
+        ([True, True, False, False, True, False, True],
+         {0: [0, 1], 2: [4], 3: [6]}),
+        ([False, False], {}),
+    ])
+    def test_groups(self, series, data, expected):
+        groups, _ = BaseEvents.group_condition_by_time(series.astype(bool))
+        assert list(groups) == list(expected)
+        for key, positions in expected.items():
+            assert groups[key].equals(series.index[positions])
+
+    @pytest.mark.parametrize('data', [
+        [False, True, True, False, True, True],
+        [True, True, False, False, True, False, True],
+    ])
+    def test_ind_sum_labels_groups(self, series, data):
+        ind = series.astype(bool)
+        groups, ind_sum = BaseEvents.group_condition_by_time(ind)
+        assert set(ind_sum[ind]) == set(groups)
+        for key, times in groups.items():
+            assert ind_sum[times].eq(key).all()
 
 
 class TestStormEvents:
@@ -32,6 +73,10 @@ class TestStormEvents:
                                  ([0.1, 0, 0.1, 0.1], 0.1, 24, 0.2, 300, 1),
                                  # Test max storm hours
                                  ([0, 0.1, 0, 0.1, 0.1, 0], 0.1, 24, 0.1, 24, 2),
+                                 # Total at the minimum despite float round off
+                                 ([0.1, 0.7, 0, 0, 0.5], 0.1, 24, 0.8, 300, 2),
+                                 # Total just under the minimum
+                                 ([0.1, 0.7, 0, 0, 0.5], 0.1, 24, 0.800001, 300, 1),
 
                              ])
     def test_storm_events_N(self, storms, data, start_mass, stop_hours,
@@ -59,6 +104,7 @@ class TestStormEvents:
         and thresholds.
         """
         storms.find(instant_mass_to_start=mass, hours_to_stop=hours)
+        np.testing.assert_array_equal(storms.totals, totals)
         assert [event.total for event in storms.events] == totals
 
     @pytest.mark.parametrize('data, mass, hours, durations', [
@@ -75,28 +121,111 @@ class TestStormEvents:
         and thresholds.
         """
         storms.find(instant_mass_to_start=mass, hours_to_stop=hours)
-        assert [event.duration for event in storms.events] == \
-               [timedelta(days=t) for t in durations]
+        expected = pd.to_timedelta(durations, unit='D')
+        assert storms.durations.equals(expected)
+        assert [event.duration for event in storms.events] == list(expected)
 
-    @pytest.mark.parametrize('station_id, start, stop, source, mass, hours, n_storms', [
-        ('TUM', datetime(2021, 12, 1), datetime(2022, 1, 15), 'CDEC', 0.1, 48, 5),
-        ('637:ID:SNTL', datetime(2022, 12, 1), datetime(2022, 12, 15),
-         'NRCS', 0.1, 48, 2)
+    @pytest.mark.parametrize('data', [[0, 1, 1, 0, 0, 1, 1, 0, 0, 1]])
+    @pytest.mark.parametrize('unit', ['ns', 'us', 'ms', 's'])
+    def test_storm_events_index_unit(self, series, data, unit, as_unit):
+        """
+        Test storms are timed the same whatever unit the index is stored in
+        """
+        storms = StormEvents(series.set_axis(as_unit(series.index, unit)))
+        storms.find(instant_mass_to_start=0.1, hours_to_stop=24,
+                    min_storm_total=1)
+        assert storms.N == 3
+        assert list(storms.durations) == list(pd.to_timedelta([2, 2, 1], unit='D'))
+
+    @pytest.mark.parametrize('data', [[0, 0.1, 0, 0.1, 0.1, 0]])
+    @pytest.mark.parametrize('unit', ['us', 's'])
+    def test_storm_events_max_hours_index_unit(self, series, data, unit,
+                                               as_unit):
+        """
+        Test the maximum storm duration splits storms on a tz aware index
+        stored in a coarser unit
+        """
+        index = as_unit(series.index.tz_localize('US/Mountain'), unit)
+        storms = StormEvents(series.set_axis(index))
+        storms.find(instant_mass_to_start=0.1, hours_to_stop=24,
+                    min_storm_total=0.1, max_storm_hours=24)
+        assert storms.N == 2
+
+    @pytest.mark.parametrize('data', [[0, 1, 1, 0, 0, 1, 1]])
+    def test_storm_events_find_resets(self, storms, data):
+        """
+        Test that repeated calls to find replace the previous events
+        """
+        storms.find(instant_mass_to_start=0.1, hours_to_stop=24)
+        storms.find(instant_mass_to_start=0.1, hours_to_stop=72)
+        assert storms.N == 1
 
-    ])
-    def test_storm_events_from_station(self, station_id, start, stop, source, mass,
-                                       hours, n_storms):
+    @pytest.fixture()
+    def station_response(self, monkeypatch, source):
         """
-        Test the number of storms identified by varying input data and thresholds.
+        Replay a daily accumulated precip response instead of hitting the
+        datasource
         """
-        storms = StormEvents.from_station(station_id, start, stop, source=source)
-        storms.find(instant_mass_to_start=mass, hours_to_stop=hours,
+        station_class = _SOURCES[source.lower()]
+        variable = station_class.ALLOWED_VARIABLES.PRECIPITATIONACCUM
+        accum = [0, 0, 0.5, 1.0, 1.0, 1.0, 1.0, 1.5, 2.5, 2.5, 2.5]
+        index = pd.MultiIndex.from_arrays(
+            [pd.date_range('2022-12-01', periods=len(accum), freq='D',
+                           tz='UTC'),
+             ['STATION'] * len(accum)],
+            names=['datetime', 'site']
+        )
+        df = pd.DataFrame({variable.name: accum}, index=index)
+
+        def get_daily_data(self, start_date, end_date, variables):
+            assert variables == [variable]
+            return df
+
+        monkeypatch.setattr(station_class, 'get_daily_data', get_daily_data)
+        yield df
+
+    @pytest.mark.parametrize('source', ['CDEC', 'NRCS'])
+    def test_storm_events_from_station(self, station_response, source):
+        """
+        Test storms are found in the incremental precip derived from the
+        accumulated station data
+        """
+        storms = StormEvents.from_station(
+            'STATION', datetime(2022, 12, 1), datetime(2022, 12, 11),
+            source=source
+        )
+        storms.find(instant_mass_to_start=0.1, hours_to_stop=48,
                     min_storm_total=0.2)
-        assert storms.N == n_storms
+        assert storms.N == 2
+        assert [event.total for event in storms.events] == [1.0, 1.5]
 
+    def test_storm_events_from_station_bad_source(self):
+        """
+        Test an unknown datasource is rejected before pulling any data
+        """
+        with pytest.raises(ValueError, match='Datasource foo is invalid'):
+            StormEvents.from_station(
+                'TUM', datetime(2021, 12, 1), datetime(2022, 1, 15),
+                source='foo'
+            )
 
-class TestSpikeValleyEvent:
+
+class TestSpikeValleyEvent(EventBoundsMixin):
     DATA_DIR = Path(__file__).parent.joinpath("data/mocks")
+    # Expected event bounds, parsed once for every parametrized case
+    EXPECTED_STARTS = pd.to_datetime([
+        '2022-11-01T08', '2022-11-11T08', '2022-11-30T08', '2022-12-29T08',
+        '2023-01-04T08', '2023-01-15T08', '2023-01-28T08', '2023-02-04T08',
+        '2023-02-12T08', '2023-02-19T08', '2023-04-23T08'
+    ]).tz_localize('UTC')
+    EXPECTED_STOPS = pd.to_datetime([
+        '2022-11-04T08', '2022-11-14T08', '2022-12-14T08', '2023-01-02T08',
+        '2023-01-07T08', '2023-01-20T08', '2023-01-31T08', '2023-02-07T08',
+        '2023-02-17T08', '2023-03-05T08', '2023-04-26T08'
+    ]).tz_localize('UTC')
+    EXPECTED_DURATIONS = pd.to_timedelta([
+        3, 3, 14, 4, 3, 5, 3, 3, 5, 14, 3
+    ], unit='D')
 
     @pytest.fixture(scope="class")
     def series(self):
@@ -118,77 +247,35 @@ class TestSpikeValleyEvent:
     def test_number_of_events(self, found_events):
         assert found_events.N == 11
 
-    @pytest.mark.parametrize(
-        "idx, start_date", [
-            (0, '2022-11-01T08:00:00+00:00'),
-            (1, '2022-11-11T08:00:00+00:00'),
-            (2, '2022-11-30T08:00:00+00:00'),
-            (3, '2022-12-29T08:00:00+00:00'),
-            (4, '2023-01-04T08:00:00+00:00'),
-            (5, '2023-01-15T08:00:00+00:00'),
-            (6, '2023-01-28T08:00:00+00:00'),
-            (7, '2023-02-04T08:00:00+00:00'),
-            (8, '2023-02-12T08:00:00+00:00'),
-            (9, '2023-02-19T08:00:00+00:00'),
-            (10, '2023-04-23T08:00:00+00:00')
-        ]
-    )
-    def test_start_dates(self, found_events, idx, start_date):
-        event = found_events.events[idx]
-        assert event.start == pd.to_datetime(start_date)
-
-    @pytest.mark.parametrize(
-        "idx, stop_date", [
-            (0, '2022-11-04T08:00:00+00:00'),
-            (1, '2022-11-14T08:00:00+00:00'),
-            (2, '2022-12-14T08:00:00+00:00'),
-            (3, '2023-01-02T08:00:00+00:00'),
-            (4, '2023-01-07T08:00:00+00:00'),
-            (5, '2023-01-20T08:00:00+00:00'),
-            (6, '2023-01-31T08:00:00+00:00'),
-            (7, '2023-02-07T08:00:00+00:00'),
-            (8, '2023-02-17T08:00:00+00:00'),
-            (9, '2023-03-05T08:00:00+00:00'),
-            (10, '2023-04-26T08:00:00+00:00')
-        ]
-    )
-    def test_stop_dates(self, found_events, idx, stop_date):
-        event = found_events.events[idx]
-        assert event.stop == pd.to_datetime(stop_date)
-
-    @pytest.mark.parametrize(
-        "idx, duration", [
-            (0, '3 days 00:00:00'),
-            (1, '3 days 00:00:00'),
-            (2, '14 days 00:00:00'),
-            (3, '4 days 00:00:00'),
-            (4, '3 days 00:00:00'),
-            (5, '5 days 00:00:00'),
-            (6, '3 days 00:00:00'),
-            (7, '3 days 00:00:00'),
-            (8, '5 days 00:00:00'),
-            (9, '14 days 00:00:00'),
-            (10, '3 days 00:00:00')
-        ]
-    )
-    def test_start_duration(self, found_events, idx, duration):
-        event = found_events.events[idx]
-        assert event.duration == pd.to_timedelta(duration)
+    @pytest.mark.parametrize('data, expected', [
+        # Valley whose width reaches past the first position
+        ([300, 0, 0, 300, 300, 300, 300, 300], [1, 1, 1, 1, 0, 0, 0, 0]),
+        # Peak whose width reaches past the first position
+        ([0, 300, 300, 0, 0, 0, 0, 0], [1, 1, 1, 1, 0, 0, 0, 0]),
+    ])
+    def test_spike_at_start(self, data, expected, base_index):
+        series = pd.Series(np.asarray(data, dtype=np.float64),
+                           index=base_index[:len(data)])
+        ind = SpikeValleyEvent.detect_spikes_using_find_peaks(series)
+        assert ind.index.equals(series.index)
+        assert ind.tolist() == [bool(v) for v in expected]
 
 
-class TestDataGapEvent:
+class TestDataGapEvent(EventBoundsMixin):
+    EXPECTED_STARTS = pd.to_datetime(['2023-01-10', '2023-02-09', '2023-03-13'])
+    EXPECTED_STOPS = pd.to_datetime(['2023-01-16', '2023-02-15', '2023-03-17'])
+    EXPECTED_DURATIONS = pd.to_timedelta([6, 6, 4], unit='D')
 
     @pytest.fixture(scope="class")
-    def gap_series(self):
+    def gap_series(self, base_index):
         data = np.array(range(100)).astype("float32")
-        index = [datetime(2023, 1, 1) + timedelta(days=i) for i in
-                 range(len(data))]
+        index = base_index[:len(data)]
         # Set nans that we will drop
         data[10:15] = np.nan
         data[40:45] = np.nan
         # gap not big enough to flag
         data[50:51] = np.nan
-        series = pd.Series(data, index=DatetimeIndex(index, freq='D'))
+        series = pd.Series(data, index=index)
         # Drop na to create time gaps
         series = series.dropna()
         # create nan that should be flagged
@@ -204,45 +291,48 @@ class TestDataGapEvent:
         events.find(min_len=3, expected_frequency="1D")
         yield events
 
+    @pytest.mark.parametrize('unit', ['us', 's'])
+    def test_hourly_gap_index_unit(self, unit, as_unit):
+        index = as_unit(
+            pd.date_range('2023-01-01', periods=10, freq=pd.Timedelta(hours=1)),
+            unit
+        )
+        series = pd.Series(np.arange(10, dtype=np.float64), index=index)
+        # Remove three hours of data
+        series = series.drop(index[4:7])
+        events = DataGapEvent(series)
+        events.find(min_len=2, expected_frequency="1h")
+        assert events.N == 1
+        assert events.events[0].start == index[3]
+        assert events.events[0].duration == pd.Timedelta(hours=4)
+
+    @pytest.mark.parametrize('unit', ['ns', 'us', 'ms', 's'])
+    def test_index_unit(self, gap_series, unit, as_unit):
+        series = gap_series.set_axis(as_unit(gap_series.index, unit))
+        events = DataGapEvent(series)
+        events.find(min_len=3, expected_frequency="1D")
+        assert events.N == len(self.EXPECTED_STARTS)
+        assert list(events.durations) == list(self.EXPECTED_DURATIONS)
+
     def test_number_of_events(self, found_events):
         assert found_events.N == 3
 
-    @pytest.mark.parametrize(
-        "idx, start_date", [
-            (0, "2023-01-10"),
-            (1, "2023-02-09"),
-            (2, "2023-03-13"),
-        ]
-    )
-    def test_start_dates(self, found_events, idx, start_date):
-        event = found_events.events[idx]
-        assert event.start == pd.to_datetime(start_date)
-
-    @pytest.mark.parametrize(
-        "idx, duration", [
-            (0, "6 days"),
-            (1, "6 days"),
-            (2, "4 days"),
-        ]
-    )
-    def test_start_duration(self, found_events, idx, duration):
-        event = found_events.events[idx]
-        assert event.duration == pd.to_timedelta(duration)
-
 
-class TestFlatlineEvent:
+class TestFlatlineEvent(EventBoundsMixin):
+    EXPECTED_STARTS = pd.to_datetime(['2023-01-12', '2023-02-11'])
+    EXPECTED_STOPS = pd.to_datetime(['2023-01-18', '2023-02-17'])
+    EXPECTED_DURATIONS = pd.to_timedelta([6, 6], unit='D')
 
     @pytest.fixture(scope="class")
-    def flat_series(self):
+    def flat_series(self, base_index):
         data = np.array(range(100)).astype("float32")
-        index = [datetime(2023, 1, 1) + timedelta(days=i) for i in
-                 range(len(data))]
+        index = base_index[:len(data)]
         # Set flatlines
         data[10:18] = 10.0
         data[40:48] = 40.0
         # not long enough to flag
         data[50:54] = 50.0
-        series = pd.Series(data, index=DatetimeIndex(index, freq='D'))
+        series = pd.Series(data, index=index)
         return series
 
     @pytest.fixture(scope="class")
@@ -257,49 +347,21 @@ class TestFlatlineEvent:
     def test_number_of_events(self, found_events):
         assert found_events.N == 2
 
-    @pytest.mark.parametrize(
-        "idx, start_date", [
-            (0, "2023-01-12"),
-            (1, "2023-02-11"),
-        ]
-    )
-    def test_start_dates(self, found_events, idx, start_date):
-        event = found_events.events[idx]
-        assert event.start == pd.to_datetime(start_date)
-
-    @pytest.mark.parametrize(
-        "idx, stop_date", [
-            (0, "2023-01-18"),
-            (1, "2023-02-17"),
-        ]
-    )
-    def test_stop_dates(self, found_events, idx, stop_date):
-        event = found_events.events[idx]
-        assert event.stop == pd.to_datetime(stop_date)
-
-    @pytest.mark.parametrize(
-        "idx, duration", [
-            (0, "6 days"),
-            (1, "6 days"),
-        ]
-    )
-    def test_start_duration(self, found_events, idx, duration):
-        event = found_events.events[idx]
-        assert event.duration == pd.to_timedelta(duration)
-
 
-class TestExtremeValueEvent:
+class TestExtremeValueEvent(EventBoundsMixin):
+    EXPECTED_STARTS = pd.to_datetime(['2023-01-11', '2023-02-10', '2023-02-20'])
+    EXPECTED_STOPS = pd.to_datetime(['2023-01-15', '2023-02-17', '2023-02-23'])
+    EXPECTED_DURATIONS = pd.to_timedelta([4, 7, 3], unit='D')
 
     @pytest.fixture(scope="class")
-    def series(self):
+    def series(self, base_index):
         data = np.array(range(100)).astype("float32")
-        index = [datetime(2023, 1, 1) + timedelta(days=i) for i in
-                 range(len(data))]
+        index = base_index[:len(data)]
         # Set extreme values
         data[10:15] = 700.0
         data[40:48] = -1.0
         data[50:54] = 601.0
-        series = pd.Series(data, index=DatetimeIndex(index, freq='D'))
+        series = pd.Series(data, index=index)
         return series
 
     @pytest.fixture(scope="class")
@@ -314,49 +376,26 @@ class TestExtremeValueEvent:
     def test_number_of_events(self, found_events):
         assert found_events.N == 3
 
-    @pytest.mark.parametrize(
-        "idx, start_date", [
-            (0, "2023-01-11"),
-            (1, "2023-02-10"),
-            (2, "2023-02-20"),
-        ]
-    )
-    def test_start_dates(self, found_events, idx, start_date):
-        event = found_events.events[idx]
-        assert event.start == pd.to_datetime(start_date)
-
-    @pytest.mark.parametrize(
-        "idx, stop_date", [
-            (0, "2023-01-15"),
-            (1, "2023-02-17"),
-            (2, "2023-02-23"),
-        ]
-    )
-    def test_stop_dates(self, found_events, idx, stop_date):
-        event = found_events.events[idx]
-        assert event.stop == pd.to_datetime(stop_date)
-
-    @pytest.mark.parametrize(
-        "idx, duration", [
-            (0, "4 days"),
-            (1, "7 days"),
-            (2, "3 days"),
-        ]
-    )
-    def test_start_duration(self, found_events, idx, duration):
-        event = found_events.events[idx]
-        assert event.duration == pd.to_timedelta(duration)
+    def test_all_in_range(self, series):
+        events = ExtremeValueEvent(series)
+        events.find(expected_max=600.0, expected_min=0.0)
+        events.find(expected_max=1000.0, expected_min=-10.0)
+        assert events.N == 0
+        assert events.events == []
 
 
-class TestExtremeChangeEvent:
+class TestExtremeChangeEvent(EventBoundsMixin):
+    EXPECTED_STARTS = pd.to_datetime(['2023-01-11', '2023-01-16'])
+    EXPECTED_STOPS = pd.to_datetime(['2023-01-11', '2023-01-16'])
+    EXPECTED_DURATIONS = pd.to_timedelta([0, 0], unit='D')
+
     @pytest.fixture(scope="class")
-    def series(self):
+    def series(self, base_index):
         data = np.array(range(100)).astype("float32")
-        index = [datetime(2023, 1, 1) + timedelta(days=i) for i in
-                 range(len(data))]
+        index = base_index[:len(data)]
         # Set extreme values
         data[10:15] = 700.0
-        series = pd.Series(data, index=DatetimeIndex(index, freq='D'))
+        series = pd.Series(data, index=index)
         return series
 
     @pytest.fixture(scope="class")
@@ -372,33 +411,3 @@ class TestExtremeChangeEvent:
 
     def test_number_of_events(self, found_events):
         assert found_events.N == 2
-
-    @pytest.mark.parametrize(
-        "idx, start_date", [
-            (0, "2023-01-11"),
-            (1, "2023-01-16"),
-        ]
-    )
-    def test_start_dates(self, found_events, idx, start_date):
-        event = found_events.events[idx]
-        assert event.start == pd.to_datetime(start_date)
-
-    @pytest.mark.parametrize(
-        "idx, stop_date", [
-            (0, "2023-01-11"),
-            (1, "2023-01-16"),
-        ]
-    )
-    def test_stop_dates(self, found_events, idx, stop_date):
-        event = found_events.events[idx]
-        assert event.stop == pd.to_datetime(stop_date)
-
-    @pytest.mark.parametrize(
-        "idx, duration", [
-            (0, "0 days"),
-            (1, "0 days"),
-        ]
-    )
-    def test_start_duration(self, found_events, idx, duration):
-        event = found_events.events[idx]
-        assert event.duration == pd.to_timedelta(duration)
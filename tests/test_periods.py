@@ -8,9 +8,8 @@ from metevents.periods import BaseTimePeriod, CumulativePeriod
 
 class TestBaseTimePeriod:
     @pytest.fixture()
-    def period(self, data):
-        index = [datetime(2023, 1, 1) + timedelta(days=i) for i in range(len(data))]
-        series = Series(data, index=index)
+    def period(self, data, base_index):
+        series = Series(data, index=base_index[:len(data)])
         return BaseTimePeriod(series)
 
     @pytest.mark.parametrize('data, expected', [
@@ -34,9 +33,8 @@ class TestBaseTimePeriod:
 
 class TestCumulativePeriod:
     @pytest.fixture()
-    def period(self, data):
-        index = [datetime(2023, 1, 1) + timedelta(days=i) for i in range(len(data))]
-        series = Series(data, index=index)
+    def period(self, data, base_index):
+        series = Series(data, index=base_index[:len(data)])
         return CumulativePeriod(series)
 
     @pytest.mark.parametrize('data, expected', [
@@ -45,3 +43,16 @@ class TestCumulativePeriod:
     ])
     def test_end(self, period, data, expected):
         assert period.total == expected
+
+    @pytest.mark.parametrize('data, start, stop, expected', [
+        ([1, 1, 2, 2], 1, 3, 3),
+        ([1, np.NaN, 2, 2], 0, 4, 5)
+    ])
+    def test_total_from_prefix_sum(self, data, start, stop, expected,
+                                   base_index):
+        series = Series(data, index=base_index[:len(data)])
+        csum = np.concatenate([[0.0], np.nancumsum(data)])
+        period = CumulativePeriod(
+            series.iloc[start:stop], csum=csum, start_iloc=start, stop_iloc=stop
+        )
+        assert period.total == expected
@@ -1,19 +1,62 @@
 import pandas as pd
 from datetime import datetime, timedelta
 import pytest
+from pandas.tseries.frequencies import to_offset
 
-from metevents.utilities import determine_freq
+from metevents.utilities import determine_freq, determine_freq_ns
 
 
 @pytest.mark.parametrize('date_data, expected', [
     # monotonic Days
-    ([datetime(2023, 1, 1) + timedelta(days=i) for i in range(10)], 'D'),
+    ([datetime(2023, 1, 1) + timedelta(days=i) for i in range(10)],
+     timedelta(days=1)),
     # monotonic hours
-    ([datetime(2023, 1, 1) + timedelta(hours=i) for i in range(10)], 'H'),
+    ([datetime(2023, 1, 1) + timedelta(hours=i) for i in range(10)],
+     timedelta(hours=1)),
+    # hours with the frequency already set on the index
+    (pd.date_range('2023-01-01', periods=10, freq=timedelta(hours=1)),
+     timedelta(hours=1)),
+    # monotonic minutes
+    ([datetime(2023, 1, 1) + timedelta(minutes=i) for i in range(10)],
+     timedelta(minutes=1)),
+    # monotonic multiple days
+    ([datetime(2023, 1, 1) + timedelta(days=2 * i) for i in range(10)],
+     timedelta(days=2)),
     # Irregular interval
     ([datetime(2023, 1, 1) + timedelta(days=i ** 2) for i in range(10)], None)
 ])
 def test_determine_freq(date_data, expected):
     series = pd.Series(range(len(date_data)), index=date_data)
     freq_str = determine_freq(series)
-    assert freq_str == expected
+    if expected is None:
+        assert freq_str is None
+    else:
+        assert pd.to_timedelta(to_offset(freq_str)) == expected
+
+
+@pytest.mark.parametrize('unit', ['us', 's'])
+def test_determine_freq_index_unit(unit, as_unit):
+    # Days stored in a coarser unit without a frequency set
+    index = as_unit(pd.DatetimeIndex(
+        [datetime(2023, 1, 1) + timedelta(days=i) for i in range(10)]
+    ), unit)
+    freq_str = determine_freq(pd.Series(range(len(index)), index=index))
+    assert pd.to_timedelta(to_offset(freq_str)) == timedelta(days=1)
+
+
+@pytest.mark.parametrize('date_data, expected', [
+    ([datetime(2023, 1, 1) + timedelta(hours=i) for i in range(10)],
+     pd.Timedelta(hours=1).value),
+    ([datetime(2023, 1, 1) + timedelta(days=2 * i) for i in range(10)],
+     pd.Timedelta(days=2).value),
+    ([datetime(2023, 1, 1) + timedelta(days=i ** 2) for i in range(10)], None),
+    ([datetime(2023, 1, 1)], None),
+])
+def test_determine_freq_ns(date_data, expected):
+    assert determine_freq_ns(pd.DatetimeIndex(date_data)) == expected
+
+
+@pytest.mark.parametrize('unit', ['us', 's'])
+def test_determine_freq_ns_index_unit(unit, as_unit):
+    index = as_unit(pd.date_range('2023-01-01', periods=10, freq='D'), unit)
+    assert determine_freq_ns(index) == pd.Timedelta(days=1).value